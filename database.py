@@ -5,11 +5,12 @@ MongoDB helper functions ready to use in your backend code.
 Import and use these functions in your API endpoints for database operations.
 """
 
-from pymongo import MongoClient
+from motor.motor_asyncio import AsyncIOMotorClient
+import redis.asyncio as redis
 from datetime import datetime, timezone
 import os
 from dotenv import load_dotenv
-from typing import Union
+from typing import List, Union
 from pydantic import BaseModel
 
 # Load environment variables from .env file
@@ -22,11 +23,19 @@ database_url = os.getenv("DATABASE_URL")
 database_name = os.getenv("DATABASE_NAME")
 
 if database_url and database_name:
-    _client = MongoClient(database_url)
+    _client = AsyncIOMotorClient(database_url)
     db = _client[database_name]
 
+# Optional response cache; disabled unless REDIS_URL is set
+cache = None
+
+redis_url = os.getenv("REDIS_URL")
+
+if redis_url:
+    cache = redis.from_url(redis_url, socket_timeout=0.25, socket_connect_timeout=0.25)
+
 # Helper functions for common database operations
-def create_document(collection_name: str, data: Union[BaseModel, dict]):
+async def create_document(collection_name: str, data: Union[BaseModel, dict]):
     """Insert a single document with timestamp"""
     if db is None:
         raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
@@ -40,16 +49,32 @@ def create_document(collection_name: str, data: Union[BaseModel, dict]):
     data_dict['created_at'] = datetime.now(timezone.utc)
     data_dict['updated_at'] = datetime.now(timezone.utc)
 
-    result = db[collection_name].insert_one(data_dict)
+    result = await db[collection_name].insert_one(data_dict)
     return str(result.inserted_id)
 
-def get_documents(collection_name: str, filter_dict: dict = None, limit: int = None):
-    """Get documents from collection"""
+async def create_documents(collection_name: str, items: List[Union[BaseModel, dict]]):
+    """Insert many documents with timestamps in a single bulk write"""
+    if db is None:
+        raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
+
+    now = datetime.now(timezone.utc)
+    docs = []
+    for data in items:
+        data_dict = data.model_dump() if isinstance(data, BaseModel) else data.copy()
+        data_dict['created_at'] = now
+        data_dict['updated_at'] = now
+        docs.append(data_dict)
+
+    result = await db[collection_name].insert_many(docs, ordered=False)
+    return [str(i) for i in result.inserted_ids]
+
+async def get_documents(collection_name: str, filter_dict: dict = None, limit: int = None, projection: dict = None, batch_size: int = 200):
+    """Get documents from collection (optionally projected), fetched in batches"""
     if db is None:
         raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
     
-    cursor = db[collection_name].find(filter_dict or {})
+    cursor = db[collection_name].find(filter_dict or {}, projection).batch_size(batch_size)
     if limit:
         cursor = cursor.limit(limit)
     
-    return list(cursor)
+    return await cursor.to_list(length=None)
@@ -1,22 +1,75 @@
+import hashlib
+import logging
 import os
+import re
+from contextlib import asynccontextmanager
 from typing import List, Optional
-from fastapi import FastAPI, HTTPException
+import numpy as np
+import orjson
+from fastapi import Depends, FastAPI, HTTPException, Request, Response
+from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from pydantic import BaseModel, TypeAdapter, ValidationError
 from bson.objectid import ObjectId
+from pymongo.errors import PyMongoError
+from redis import RedisError
 
-from database import db, create_document, get_documents
+from database import db, cache, create_document, create_documents, get_documents
 from schemas import Product, Review, User, Order
 
-app = FastAPI(title="MC Alger Store API")
+try:
+    from numba import njit
+except ImportError:  # pinned in requirements.txt; large carts fall back to plain NumPy without it
+    njit = None
+
+logger = logging.getLogger(__name__)
+
+
+def _orjson_default(obj):
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    raise TypeError
+
+
+def mongo_json_dumps(content) -> bytes:
+    return orjson.dumps(
+        content,
+        default=_orjson_default,
+        option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NAIVE_UTC,
+    )
+
+
+class MongoJSONResponse(ORJSONResponse):
+    """orjson-encoded response that also knows how to stringify ObjectId.
+
+    Handlers return it directly: a plain dict would first go through
+    FastAPI's jsonable_encoder, which fails on ObjectId and turns datetimes
+    into strings before render() sees them.
+    """
+
+    def render(self, content) -> bytes:
+        return mongo_json_dumps(content)
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await ensure_indexes()
+    warm_up_cart_kernel()
+    yield
+
+
+app = FastAPI(title="MC Alger Store API", default_response_class=MongoJSONResponse, lifespan=lifespan)
+
+# Same-origin deployments can set CORS_DISABLED to drop the middleware entirely
+if not os.getenv("CORS_DISABLED"):
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=["GET", "POST"],
+        allow_headers=["content-type", "authorization"],
+    )
 
 
 # Helpers
@@ -24,144 +77,266 @@ class Obj(BaseModel):
     id: str
 
 
+# The database handle is fixed at import, so resolve readiness once
+_DB_READY = db is not None
+
+
+async def require_db():
+    if not _DB_READY:
+        raise HTTPException(status_code=500, detail="Database not configured")
+
+
+async def product_object_id(product_id: str) -> ObjectId:
+    if not ObjectId.is_valid(product_id):
+        raise HTTPException(status_code=400, detail="Invalid product id")
+    return ObjectId(product_id)
+
+
+# Fields needed to render a product card in list views
+PRODUCT_CARD_PROJECTION = {
+    "title": 1,
+    "price": 1,
+    "category": 1,
+    "color": 1,
+    "collection": 1,
+    "rating": 1,
+    "reviews_count": 1,
+    "in_stock": 1,
+    "images": {"$slice": 1},
+}
+
+
+# Product fields matched exactly by the /products query params
+_FILTER_FIELDS = ("category", "color", "collection", "sizes")
+
+# Single-word searches can be served by the title text index. Note that $text
+# matches whole (stemmed) words, so "hood" does not match "Hoodie" the way the
+# substring regex used for multi-word queries does.
+_SIMPLE_QUERY_RE = re.compile(r"^\w+$")
+
+
+def body_openapi(adapter: TypeAdapter) -> dict:
+    """openapi_extra documenting a request body that parse_body validates"""
+    return {
+        "requestBody": {
+            "content": {"application/json": {"schema": adapter.json_schema()}},
+            "required": True,
+        }
+    }
+
+
+async def parse_body(adapter: TypeAdapter, request: Request):
+    """Validate the raw request body in a single pass with a prebuilt adapter"""
+    body = await request.body()
+    try:
+        return adapter.validate_json(body)
+    except ValidationError as e:
+        # Same shape FastAPI gives its own body errors: loc is rooted at "body"
+        errors = [{**err, "loc": ("body", *err["loc"])} for err in e.errors(include_url=False)]
+        raise RequestValidationError(errors, body=body)
+
+
+# Cached /products responses, keyed by the normalized filter
+PRODUCTS_CACHE_PREFIX = "products:"
+PRODUCTS_CACHE_TTL = 30
+
+
+def products_cache_key(filter_dict: dict) -> str:
+    digest = hashlib.blake2b(orjson.dumps(sorted(filter_dict.items())), digest_size=8).hexdigest()
+    return PRODUCTS_CACHE_PREFIX + digest
+
+
+async def invalidate_products_cache():
+    if cache is None:
+        return
+    try:
+        keys = [k async for k in cache.scan_iter(match=PRODUCTS_CACHE_PREFIX + "*")]
+        if keys:
+            await cache.delete(*keys)
+    except RedisError:
+        logger.exception("Failed to invalidate cached /products responses")
+
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+async def stream_products(filter_dict: dict):
+    cursor = db["product"].find(filter_dict, PRODUCT_CARD_PROJECTION).batch_size(500)
+    async for d in cursor:
+        d["id"] = str(d.pop("_id"))
+        yield mongo_json_dumps(d) + b"\n"
+
+
 def to_public(doc):
     if not doc:
         return doc
-    doc["id"] = str(doc.get("_id"))
-    doc.pop("_id", None)
+    oid = doc.pop("_id", None)
+    if oid is not None:
+        doc["id"] = str(oid)
     return doc
 
 
+async def ensure_indexes():
+    # Best effort: the API still starts (and /test reports the error) if Mongo is unreachable
+    if not _DB_READY:
+        return
+    try:
+        await db["product"].create_index([("title", "text")])
+        await db["product"].create_index([("category", 1), ("color", 1), ("collection", 1)])
+        await db["product"].create_index([("sizes", 1), ("in_stock", 1)])
+        await db["review"].create_index([("product_id", 1)])
+    except PyMongoError:
+        logger.exception("Failed to create MongoDB indexes")
+
+
 @app.get("/")
-def read_root():
-    return {"message": "MC Alger Store API running"}
+async def read_root():
+    return MongoJSONResponse({"message": "MC Alger Store API running"})
+
+
+_TEST_TEMPLATE = {
+    "backend": "✅ Running",
+    "database": "❌ Not Available",
+    "database_url": "✅ Set" if os.getenv("DATABASE_URL") else "❌ Not Set",
+    "database_name": "✅ Set" if os.getenv("DATABASE_NAME") else "❌ Not Set",
+    "connection_status": "Not Connected",
+    "collections": []
+}
 
 
 @app.get("/test")
-def test_database():
-    response = {
-        "backend": "✅ Running",
-        "database": "❌ Not Available",
-        "database_url": "✅ Set" if os.getenv("DATABASE_URL") else "❌ Not Set",
-        "database_name": "✅ Set" if os.getenv("DATABASE_NAME") else "❌ Not Set",
-        "connection_status": "Not Connected",
-        "collections": []
-    }
+async def test_database():
+    response = dict(_TEST_TEMPLATE)
     try:
-        if db is not None:
+        if _DB_READY:
             response["database"] = "✅ Available"
             response["connection_status"] = "Connected"
-            response["collections"] = db.list_collection_names()
+            response["collections"] = await db.list_collection_names()
             response["database"] = "✅ Connected & Working"
     except Exception as e:
         response["database"] = f"⚠️ Error: {str(e)[:80]}"
-    return response
+    return MongoJSONResponse(response)
+
+
+# Seed minimal catalog if empty. The sample data is a static literal, so it is
+# only run through the Product model when SEED_VALIDATE is set (debugging aid).
+SEED_VALIDATE = bool(os.getenv("SEED_VALIDATE"))
+
+_SAMPLE_PRODUCTS = (
+    {
+        "title": "MC Alger Home Kit 2024",
+        "description": "Official home kit in green with red trim. Lightweight fabric, breathable panels, embroidered crest.",
+        "price": 12999.0,
+        "category": "t-shirt",
+        "color": "green",
+        "collection": "home",
+        "sizes": ["S","M","L","XL"],
+        "images": [{"url": "https://images.unsplash.com/photo-1546519638-68e109498ffc?q=80&w=1200", "alt": "Home kit"}],
+        "rating": 4.9,
+        "reviews_count": 128,
+        "in_stock": True,
+    },
+    {
+        "title": "MCA Training Tracksuit",
+        "description": "High-performance tracksuit with MCA crest. Tapered fit, zip pockets, moisture-wicking.",
+        "price": 18999.0,
+        "category": "tracksuit",
+        "color": "green",
+        "collection": "training",
+        "sizes": ["M","L","XL"],
+        "images": [{"url": "https://images.unsplash.com/photo-1511735111819-9a3f7709049c?q=80&w=1200", "alt": "Tracksuit"}],
+        "rating": 4.7,
+        "reviews_count": 76,
+        "in_stock": True,
+    },
+    {
+        "title": "Retro 1990s Hoodie",
+        "description": "Throwback hoodie inspired by MCA 90s era. Cozy fleece, vintage crest patch.",
+        "price": 14999.0,
+        "category": "hoodie",
+        "color": "red",
+        "collection": "retro",
+        "sizes": ["S","M","L"],
+        "images": [{"url": "https://images.unsplash.com/photo-1544025162-d76694265947?q=80&w=1200", "alt": "Retro hoodie"}],
+        "rating": 4.6,
+        "reviews_count": 52,
+        "in_stock": True,
+    },
+)
 
 
-# Seed minimal catalog if empty
-@app.post("/seed")
-def seed_catalog():
-    if db is None:
-        raise HTTPException(status_code=500, detail="Database not configured")
-    if db["product"].count_documents({}) > 0:
-        return {"status": "exists"}
-
-    sample_products = [
-        Product(
-            title="MC Alger Home Kit 2024",
-            description="Official home kit in green with red trim. Lightweight fabric, breathable panels, embroidered crest.",
-            price=12999,
-            category="t-shirt",
-            color="green",
-            collection="home",
-            sizes=["S","M","L","XL"],
-            images=[{"url": "https://images.unsplash.com/photo-1546519638-68e109498ffc?q=80&w=1200", "alt": "Home kit"}],
-            rating=4.9,
-            reviews_count=128,
-            in_stock=True
-        ),
-        Product(
-            title="MCA Training Tracksuit",
-            description="High-performance tracksuit with MCA crest. Tapered fit, zip pockets, moisture-wicking.",
-            price=18999,
-            category="tracksuit",
-            color="green",
-            collection="training",
-            sizes=["M","L","XL"],
-            images=[{"url": "https://images.unsplash.com/photo-1511735111819-9a3f7709049c?q=80&w=1200", "alt": "Tracksuit"}],
-            rating=4.7,
-            reviews_count=76,
-            in_stock=True
-        ),
-        Product(
-            title="Retro 1990s Hoodie",
-            description="Throwback hoodie inspired by MCA 90s era. Cozy fleece, vintage crest patch.",
-            price=14999,
-            category="hoodie",
-            color="red",
-            collection="retro",
-            sizes=["S","M","L"],
-            images=[{"url": "https://images.unsplash.com/photo-1544025162-d76694265947?q=80&w=1200", "alt": "Retro hoodie"}],
-            rating=4.6,
-            reviews_count=52,
-            in_stock=True
-        ),
-    ]
-
-    for p in sample_products:
-        create_document("product", p)
-
-    return {"status": "seeded", "count": len(sample_products)}
+@app.post("/seed", dependencies=[Depends(require_db)])
+async def seed_catalog():
+    if await db["product"].estimated_document_count() > 0:
+        return MongoJSONResponse({"status": "exists"})
 
+    if SEED_VALIDATE:
+        for p in _SAMPLE_PRODUCTS:
+            Product.model_validate(p)
 
-# Products
-@app.get("/products")
-def list_products(q: Optional[str] = None, category: Optional[str] = None, color: Optional[str] = None, size: Optional[str] = None, collection: Optional[str] = None):
-    if db is None:
-        raise HTTPException(status_code=500, detail="Database not configured")
+    inserted = await create_documents("product", list(_SAMPLE_PRODUCTS))
+    await invalidate_products_cache()
 
-    filter_dict = {}
+    return MongoJSONResponse({"status": "seeded", "count": len(inserted)})
+
+
+# Products
+@app.get("/products", dependencies=[Depends(require_db)])
+async def list_products(request: Request, q: Optional[str] = None, category: Optional[str] = None, color: Optional[str] = None, size: Optional[str] = None, collection: Optional[str] = None):
+    filter_dict = {f: v for f, v in zip(_FILTER_FIELDS, (category, color, collection, size)) if v}
     if q:
-        filter_dict["title"] = {"$regex": q, "$options": "i"}
-    if category:
-        filter_dict["category"] = category
-    if color:
-        filter_dict["color"] = color
-    if collection:
-        filter_dict["collection"] = collection
-    if size:
-        filter_dict["sizes"] = size
-
-    items = get_documents("product", filter_dict)
-    return [to_public(i) for i in items]
-
-
-@app.get("/products/{product_id}")
-def get_product(product_id: str):
-    if db is None:
-        raise HTTPException(status_code=500, detail="Database not configured")
-    doc = db["product"].find_one({"_id": ObjectId(product_id)})
+        if _SIMPLE_QUERY_RE.match(q):
+            filter_dict["$text"] = {"$search": q}
+        else:
+            filter_dict["title"] = {"$regex": q, "$options": "i"}
+
+    # Exports and admin views can ask for NDJSON to stream large result sets
+    if NDJSON_MEDIA_TYPE in request.headers.get("accept", ""):
+        return StreamingResponse(stream_products(filter_dict), media_type=NDJSON_MEDIA_TYPE)
+
+    if cache is not None:
+        key = products_cache_key(filter_dict)
+        try:
+            cached = await cache.get(key)
+        except RedisError:
+            # Cache is best effort; fall through to Mongo
+            cached = None
+        if cached:
+            return Response(content=cached, media_type="application/json")
+
+    items = await get_documents("product", filter_dict, projection=PRODUCT_CARD_PROJECTION)
+    items = [{"id": str(d.pop("_id")), **d} for d in items]
+    if cache is None:
+        return MongoJSONResponse(items)
+    body = mongo_json_dumps(items)
+    try:
+        await cache.set(key, body, ex=PRODUCTS_CACHE_TTL)
+    except RedisError:
+        logger.exception("Failed to cache /products response")
+    return Response(content=body, media_type="application/json")
+
+
+@app.get("/products/{product_id}", dependencies=[Depends(require_db)])
+async def get_product(product_oid: ObjectId = Depends(product_object_id)):
+    doc = await db["product"].find_one({"_id": product_oid})
     if not doc:
         raise HTTPException(status_code=404, detail="Product not found")
-    return to_public(doc)
+    return MongoJSONResponse(to_public(doc))
 
 
-class ReviewIn(Review):
-    pass
+_REVIEW_ADAPTER = TypeAdapter(Review)
 
 
-@app.post("/products/{product_id}/reviews")
-def add_review(product_id: str, payload: ReviewIn):
-    if db is None:
-        raise HTTPException(status_code=500, detail="Database not configured")
+@app.post("/products/{product_id}/reviews", dependencies=[Depends(require_db)], openapi_extra=body_openapi(_REVIEW_ADAPTER))
+async def add_review(request: Request, product_oid: ObjectId = Depends(product_object_id)):
+    payload = await parse_body(_REVIEW_ADAPTER, request)
     # Ensure product exists
-    prod = db["product"].find_one({"_id": ObjectId(product_id)})
-    if not prod:
+    if not await db["product"].count_documents({"_id": product_oid}, limit=1):
         raise HTTPException(status_code=404, detail="Product not found")
     data = payload.model_dump()
-    data["product_id"] = product_id
-    create_document("review", data)
-    return {"status": "ok"}
+    data["product_id"] = str(product_oid)
+    await create_document("review", data)
+    return MongoJSONResponse({"status": "ok"})
 
 
 # Wishlist (anonymous simple endpoint; could be tied to user later)
@@ -169,10 +344,14 @@ class WishlistItem(BaseModel):
     product_id: str
 
 
-@app.post("/wishlist")
-def wishlist_add(item: WishlistItem):
-    create_document("wishlist", item.model_dump())
-    return {"status": "ok"}
+_WISHLIST_ADAPTER = TypeAdapter(WishlistItem)
+
+
+@app.post("/wishlist", openapi_extra=body_openapi(_WISHLIST_ADAPTER))
+async def wishlist_add(request: Request):
+    item = await parse_body(_WISHLIST_ADAPTER, request)
+    await create_document("wishlist", item.model_dump())
+    return MongoJSONResponse({"status": "ok"})
 
 
 # Orders / Checkout (simplified without payments integration for now)
@@ -182,31 +361,76 @@ class CheckoutIn(BaseModel):
     shipping_address: Optional[dict] = None
 
 
-@app.post("/checkout")
-def checkout(payload: CheckoutIn):
-    total = 0.0
-    for it in payload.items:
-        total += float(it.get("price", 0)) * int(it.get("qty", 1))
+_CHECKOUT_ADAPTER = TypeAdapter(CheckoutIn)
+
+# Below this many line items NumPy setup costs more than the Python loop
+_VECTOR_TOTAL_MIN_ITEMS = 32
+
+
+# Only carts this large amortize the JIT compile/warm-up cost
+_JIT_TOTAL_MIN_ITEMS = 1024
+
+if njit is not None:
+    # No fastmath: a money total must not depend on reordered additions
+    @njit(cache=True)
+    def _jit_total(prices, qtys):
+        s = 0.0
+        for i in range(prices.shape[0]):
+            s += prices[i] * qtys[i]
+        return s
+else:
+    _jit_total = None
+
+
+def warm_up_cart_kernel():
+    """Compile the JIT kernel before serving so no checkout pays for it"""
+    if _jit_total is not None:
+        _jit_total(np.zeros(1, dtype=np.float64), np.zeros(1, dtype=np.int64))
+
+
+def cart_total(items: List[dict]) -> float:
+    n = len(items)
+    if n <= _VECTOR_TOTAL_MIN_ITEMS:
+        total = 0.0
+        for it in items:
+            total += float(it.get("price", 0)) * int(it.get("qty", 1))
+        return total
+    prices = np.fromiter((float(it.get("price", 0)) for it in items), dtype=np.float64, count=n)
+    qtys = np.fromiter((int(it.get("qty", 1)) for it in items), dtype=np.int64, count=n)
+    if _jit_total is not None and n >= _JIT_TOTAL_MIN_ITEMS:
+        return float(_jit_total(prices, qtys))
+    return float((prices * qtys).sum())
+
+
+@app.post("/checkout", openapi_extra=body_openapi(_CHECKOUT_ADAPTER))
+async def checkout(request: Request):
+    payload = await parse_body(_CHECKOUT_ADAPTER, request)
+    total = cart_total(payload.items)
     order = Order(items=[
         {"product_id": i.get("product_id"), "title": i.get("title"), "price": float(i.get("price", 0)), "size": i.get("size"), "qty": int(i.get("qty", 1))}
         for i in payload.items
     ], total=total, currency="DZD", email=payload.email, shipping_address=payload.shipping_address)
-    oid = create_document("order", order)
-    return {"status": "ok", "order_id": oid, "total": total}
+    oid = await create_document("order", order)
+    return MongoJSONResponse({"status": "ok", "order_id": oid, "total": total})
+
+
+# Schema insight for dev tools (static, so computed and encoded once at import)
+_SCHEMA_CACHE = {
+    "user": User.model_json_schema(),
+    "product": Product.model_json_schema(),
+    "review": Review.model_json_schema(),
+    "order": Order.model_json_schema(),
+}
+_SCHEMA_JSON = orjson.dumps(_SCHEMA_CACHE)
 
 
-# Schema insight for dev tools
 @app.get("/schema")
-def schema_overview():
-    return {
-        "user": User.model_json_schema(),
-        "product": Product.model_json_schema(),
-        "review": Review.model_json_schema(),
-        "order": Order.model_json_schema(),
-    }
+async def schema_overview():
+    return Response(content=_SCHEMA_JSON, media_type="application/json")
 
 
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("PORT", 8000))
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    workers = int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1))
+    uvicorn.run("main:app", host="0.0.0.0", port=port, loop="uvloop", http="httptools", workers=workers)
@@ -4,13 +4,41 @@ Database Schemas for MC Alger E‑Commerce
 Each Pydantic model represents a MongoDB collection. The collection name is the
 lowercased class name by convention in this project.
 """
-from typing import List, Optional
-from pydantic import BaseModel, Field, EmailStr
+import re
+from functools import lru_cache
+from typing import Annotated, List, Optional
+from pydantic import BaseModel, BeforeValidator, Field, WithJsonSchema
+
+
+# Domain labels exclude dots so the pattern cannot backtrack over long input
+_EMAIL_RE = re.compile(r"^[^@\s]+@[^@\s.]+(?:\.[^@\s.]+)+$")
+_EMAIL_MAX_LENGTH = 254
+
+
+@lru_cache(maxsize=8192)
+def _check_email(value: str) -> str:
+    if not _EMAIL_RE.match(value):
+        raise ValueError("value is not a valid email address")
+    return value
+
+
+def _validate_email(value):
+    # Non-strings fall through to the str validator so they get its error
+    if not isinstance(value, str):
+        return value
+    # Checked before the cache so oversized strings are never retained
+    if len(value) > _EMAIL_MAX_LENGTH:
+        raise ValueError("value is not a valid email address")
+    return _check_email(value)
+
+
+# Lightweight email check; not full RFC 5321 validation
+Email = Annotated[str, BeforeValidator(_validate_email), WithJsonSchema({"type": "string", "format": "email"})]
 
 
 class User(BaseModel):
     name: str = Field(..., description="Full name")
-    email: EmailStr = Field(..., description="Email address")
+    email: Email = Field(..., description="Email address")
     password: str = Field(..., min_length=6, description="Hashed password or secret")
     avatar_url: Optional[str] = Field(None, description="Profile avatar URL")
     is_active: bool = Field(True, description="Whether user is active")
@@ -58,5 +86,5 @@ class Order(BaseModel):
     total: float
     currency: str = Field("DZD")
     status: str = Field("pending")
-    email: Optional[EmailStr] = None
+    email: Optional[Email] = None
     shipping_address: Optional[dict] = None
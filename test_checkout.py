@@ -0,0 +1,50 @@
+import random
+
+import numpy as np
+
+import main
+
+
+def _items(n):
+    # Whole and half-dinar prices sum exactly, so any summation order agrees
+    rng = random.Random(n)
+    return [{"price": rng.randint(100, 20000) / 2, "qty": rng.randint(1, 5)} for _ in range(n)]
+
+
+def _python_total(items):
+    total = 0.0
+    for it in items:
+        total += float(it.get("price", 0)) * int(it.get("qty", 1))
+    return total
+
+
+def test_jit_kernel_is_available():
+    assert main._jit_total is not None
+
+
+def test_jit_kernel_sums_in_order():
+    rng = random.Random(0)
+    prices = np.array([rng.uniform(0, 50000) for _ in range(5000)], dtype=np.float64)
+    qtys = np.array([rng.randint(1, 9) for _ in range(5000)], dtype=np.int64)
+    expected = 0.0
+    for p, q in zip(prices.tolist(), qtys.tolist()):
+        expected += p * q
+    assert main._jit_total(prices, qtys) == expected
+
+
+def test_cart_total_matches_across_thresholds():
+    for n in (
+        main._VECTOR_TOTAL_MIN_ITEMS,
+        main._VECTOR_TOTAL_MIN_ITEMS + 1,
+        main._JIT_TOTAL_MIN_ITEMS - 1,
+        main._JIT_TOTAL_MIN_ITEMS,
+    ):
+        items = _items(n)
+        assert main.cart_total(items) == _python_total(items)
+
+
+def test_jit_and_numpy_paths_agree(monkeypatch):
+    items = _items(main._JIT_TOTAL_MIN_ITEMS * 2)
+    jit_total = main.cart_total(items)
+    monkeypatch.setattr(main, "_jit_total", None)
+    assert main.cart_total(items) == jit_total
@@ -0,0 +1,30 @@
+import time
+
+import pytest
+from pydantic import ValidationError
+
+from schemas import _EMAIL_RE, Order, User
+
+
+def test_email_accepts_common_addresses():
+    for email in ("fan@mca.dz", "first.last@mail.example.com"):
+        assert User(name="Fan", email=email, password="secret").email == email
+
+
+@pytest.mark.parametrize("email", ["plain", "a@b", "a@.b", "a@b.", "a b@c.dz"])
+def test_email_rejects_malformed_addresses(email):
+    with pytest.raises(ValidationError):
+        User(name="Fan", email=email, password="secret")
+
+
+def test_email_rejects_overlong_address():
+    email = "a@" + "b" * 250 + ".dz"
+    with pytest.raises(ValidationError):
+        Order(items=[], total=0, email=email)
+
+
+def test_email_pattern_stays_linear_on_long_input():
+    # Used to backtrack quadratically on dotted domains with a bad tail
+    start = time.perf_counter()
+    assert _EMAIL_RE.match("a@" + "b." * 50000 + " ") is None
+    assert time.perf_counter() - start < 0.5